@@ -1,13 +1,19 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
+import atexit
 import os
 from models.challenge import Challenge
 from models.user import User
 from services.embedding_service import EmbeddingService
 from services.gemini_service import GeminiService
+from services.caption_service import create_caption_service
 from database.mongodb import MongoDB
-import magic
+from utils.validation import MAX_CONTENT_LENGTH, validate_image
+from utils.serialization import ChallengeJSONCache, dumps, encode_response
+from utils.in_flight import InFlightGauge
+from services.stats_buffer import StatsBuffer
+from services.leaderboard_events import HEARTBEAT, HEARTBEAT_INTERVAL, TooManySubscribers, create_leaderboard_broker, format_sse
 from werkzeug.utils import secure_filename
 from typing import Dict, List
 import numpy as np
@@ -20,34 +26,50 @@ CORS(app)
 
 # Initialize services
 db = MongoDB()
-embedding_service = EmbeddingService()
 gemini_service = GeminiService()
+# CAPTION_BACKEND=local moves captions on-device so Gemini is only used for
+# riddles and hints (re-caption stored challenges first, see caption_service.py)
+caption_service = create_caption_service(gemini_service)
+embedding_service = EmbeddingService(caption_service)
+
+# User stats are buffered in memory and flushed as bulk $inc writes
+stats_buffer = StatsBuffer(db.users)
+stats_buffer.start()
+atexit.register(stats_buffer.stop)
+
+# Live leaderboard fan-out for SSE subscribers. Here every open stream holds a
+# request thread for as long as it stays connected, so the cap has to stay well
+# below the server's thread count or streams starve regular requests. Serve the
+# stream from async_app.py for more subscribers.
+leaderboard_broker = create_leaderboard_broker(
+    db.challenges,
+    max_subscribers=int(os.getenv('LEADERBOARD_SYNC_MAX_SUBSCRIBERS', 4))
+)
+leaderboard_broker.start()
+atexit.register(leaderboard_broker.stop)
+
+# Serialized challenges, keyed by challenge version
+challenge_json_cache = ChallengeJSONCache()
+
+# Guesses being worked on right now, reported at /api/metrics/in_flight
+guess_gauge = InFlightGauge()
 
 # Configuration
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
-MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+def json_response(body: bytes, compressible: bool = False, status: int = 200):
+    body, headers = encode_response(body, request.headers.get('Accept-Encoding'), compressible)
+    return Response(body, status=status, headers=headers)
 
-def validate_image(file):
-    if not file:
-        return False, "No file provided"
-    if not allowed_file(file.filename):
-        return False, "Invalid file type"
-    if file.content_length and file.content_length > MAX_CONTENT_LENGTH:
-        return False, "File too large"
-        
-    # Check MIME type using the first 1024 bytes
-    mime = magic.Magic(mime=True)
-    file_mime = mime.from_buffer(file.read(1024))
-    file.seek(0)
-    
-    if not file_mime.startswith('image/'):
-        return False, "Invalid file type"
-        
-    return True, None
+@app.before_request
+def track_guess_start():
+    if request.endpoint == 'submit_guess':
+        guess_gauge.enter()
+
+@app.teardown_request
+def track_guess_end(exc=None):
+    if request.endpoint == 'submit_guess':
+        guess_gauge.exit()
 
 # -------------------------------
 # Authentication endpoints
@@ -97,6 +119,53 @@ def login():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# -------------------------------
+# User endpoints
+# -------------------------------
+@app.route('/api/users/<user_id>/stats', methods=['GET'])
+def get_user_stats(user_id):
+    try:
+        stats = db.get_user_stats(user_id)
+        if stats is None:
+            return jsonify({'error': 'User not found'}), 404
+        # Include increments that are still buffered in this process
+        return jsonify(stats_buffer.merge_pending(user_id, stats))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# -------------------------------
+# Global leaderboard endpoints
+# -------------------------------
+@app.route('/api/leaderboard', methods=['GET'])
+def get_global_leaderboard():
+    try:
+        page = request.args.get('page', 1, type=int)
+        page_size = request.args.get('page_size', 20, type=int)
+        leaderboard = db.get_global_leaderboard(page, page_size)
+        return json_response(dumps(leaderboard), compressible=True)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/leaderboard/users/<user_id>', methods=['GET'])
+def get_global_rank(user_id):
+    try:
+        entry = db.get_global_rank(user_id)
+        if not entry:
+            return jsonify({'error': 'User has no solves yet'}), 404
+        return jsonify(entry)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# -------------------------------
+# Metrics endpoints
+# -------------------------------
+@app.route('/api/metrics/in_flight', methods=['GET'])
+def get_in_flight():
+    # ?reset=1 starts a new peak window, load_test.py does this before a run
+    return jsonify(guess_gauge.snapshot(reset=request.args.get('reset') == '1'))
+
 # -------------------------------
 # Challenge endpoints
 # -------------------------------
@@ -125,8 +194,8 @@ def create_challenge():
         os.makedirs('uploads', exist_ok=True)
         photo.save(photo_path)
 
-        # Generate caption using Gemini
-        caption = gemini_service.generate_caption(photo_path)
+        # Generate caption
+        caption = caption_service.generate_caption(photo_path)
 
         # prepend a riddle to description
         description = description+'\n\n'+gemini_service.generate_riddle(photo_path) 
@@ -138,11 +207,13 @@ def create_challenge():
             description=description,
             boundary=boundary,
             photo_path=photo_path,
-            caption=caption
+            caption=caption,
+            caption_backend=caption_service.name
         )
 
         # Save to the database
         challenge_id = db.save_challenge(challenge)
+        stats_buffer.increment(user_id, challenges_created=1)
 
         return jsonify({
             'message': 'Challenge created successfully',
@@ -155,8 +226,11 @@ def create_challenge():
 @app.route('/api/challenges', methods=['GET'])
 def get_challenges():
     try:
-        challenges = db.get_all_challenges()
-        return jsonify([challenge.to_dict() for challenge in challenges])
+        # Full documents (embeddings included) are only loaded for cache misses
+        versions = db.get_challenge_versions()
+        hits, missing = challenge_json_cache.lookup(versions)
+        loaded = db.get_challenges_by_ids(missing)
+        return json_response(challenge_json_cache.dumps_list(versions, hits, loaded), compressible=True)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -189,7 +263,7 @@ def submit_guess(challenge_id):
         
         # Get captions
         answer_caption = challenge.caption
-        guess_caption = gemini_service.generate_caption(guess_photo_path)
+        guess_caption = caption_service.generate_caption(guess_photo_path)
 
         # print('ac',answer_caption,'gc', guess_caption)
 
@@ -212,10 +286,19 @@ def submit_guess(challenge_id):
 
         if is_correct:
             # Update leaderboard if guess is correct
-            db.update_leaderboard(challenge_id, user_id, username, guess_count)
+            solve = db.update_leaderboard(challenge_id, user_id, username, guess_count)
+            if solve:
+                leaderboard_broker.publish(challenge_id, {'type': solve, 'entry': {
+                    'user_id': user_id,
+                    'username': username,
+                    'guess_count': guess_count
+                }})
+            # Only a first solve of this challenge counts towards challenges_solved
+            stats_buffer.increment(user_id, total_guesses=1, challenges_solved=1 if solve == 'added' else 0)
             feedback = "Congratulations! You've solved the challenge!"
         else:
             # Generate a hint using the Gemini service
+            stats_buffer.increment(user_id, total_guesses=1)
             feedback = gemini_service.generate_hint(challenge.photo_path, guess_photo_path)
             
         return jsonify({
@@ -232,11 +315,48 @@ def submit_guess(challenge_id):
 def get_leaderboard(challenge_id):
     try:
         leaderboard = db.get_leaderboard(challenge_id)
-        return jsonify(leaderboard)
+        return json_response(dumps(leaderboard), compressible=True)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/challenges/<challenge_id>/leaderboard/stream', methods=['GET'])
+def stream_leaderboard(challenge_id):
+    """
+    Server-Sent Events stream of a challenge leaderboard: a 'snapshot' event
+    first, then 'added'/'improved' deltas keyed by user_id. A new snapshot is
+    sent whenever this subscriber fell behind.
+
+    Each stream occupies a request thread until the client disconnects, so
+    only LEADERBOARD_SYNC_MAX_SUBSCRIBERS are accepted at once (503 after
+    that). async_app.py serves the same stream without holding threads.
+    """
+    try:
+        subscription = leaderboard_broker.subscribe(challenge_id)
+    except TooManySubscribers as e:
+        return jsonify({'error': str(e)}), 503
+
+    def events():
+        try:
+            # Subscribed before the snapshot is read, so no change is missed
+            yield format_sse('snapshot', db.get_leaderboard(challenge_id))
+            while True:
+                event = subscription.get(HEARTBEAT_INTERVAL)
+                if event is None:
+                    # Also how a disconnected client is noticed
+                    yield HEARTBEAT
+                elif event['type'] == 'resync':
+                    yield format_sse('snapshot', db.get_leaderboard(challenge_id))
+                else:
+                    yield format_sse(event['type'], event['entry'])
+        finally:
+            leaderboard_broker.unsubscribe(subscription)
+
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/api/challenges/<challenge_id>', methods=['GET'])
 def get_challenge(challenge_id):
     """
@@ -246,9 +366,18 @@ def get_challenge(challenge_id):
         challenge = db.get_challenge(challenge_id)
         if not challenge:
             return jsonify({'error': 'Challenge not found'}), 404
-        return jsonify(challenge.to_dict())
+        return json_response(challenge_json_cache.get(challenge))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.cli.command('rebuild-global-leaderboard')
+def rebuild_global_leaderboard():
+    """
+    Recomputes the global leaderboard from every challenge's leaderboard.
+    Run with: flask --app app rebuild-global-leaderboard
+    """
+    count = db.rebuild_global_leaderboard()
+    print(f"Rebuilt global leaderboard with {count} users")
+
 if __name__ == '__main__':
     app.run(debug=True)
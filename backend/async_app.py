@@ -0,0 +1,391 @@
+"""
+Async serving mode. Exposes the same routes as app.py on Quart so a request
+waiting on Mongo (motor) or Gemini does not hold an OS thread. CLIP inference
+and local captioning are CPU/GPU-bound and run in a bounded thread pool.
+
+Run with:
+    hypercorn async_app:app --bind 0.0.0.0:8000
+"""
+from quart import Quart, Response, request, jsonify
+from quart_cors import cors
+from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+from models.challenge import Challenge
+from models.user import User
+from services.embedding_service import EmbeddingService
+from services.gemini_service import GeminiService
+from services.caption_service import create_caption_service
+from database.async_mongodb import AsyncMongoDB
+from utils.validation import MAX_CONTENT_LENGTH, validate_image
+from utils.serialization import ChallengeJSONCache, dumps, encode_response
+from utils.in_flight import InFlightGauge
+from services.stats_buffer import StatsBuffer
+from services.leaderboard_events import HEARTBEAT, HEARTBEAT_INTERVAL, TooManySubscribers, create_leaderboard_broker, format_sse
+from werkzeug.utils import secure_filename
+
+# Load environment variables
+load_dotenv()
+
+app = Quart(__name__)
+app = cors(app)
+
+# Initialize services
+db = AsyncMongoDB()
+gemini_service = GeminiService()
+caption_service = create_caption_service(gemini_service)
+embedding_service = EmbeddingService(caption_service)
+
+# Torch releases the GIL during inference, so a few threads are enough to keep
+# the model busy without oversubscribing the CPU
+clip_executor = ThreadPoolExecutor(max_workers=int(os.getenv('CLIP_WORKERS', 2)))
+
+# User stats are buffered in memory and flushed as bulk $inc writes. The
+# flush runs on its own thread, so it uses motor's underlying pymongo collection
+stats_buffer = StatsBuffer(db.users.delegate)
+
+# Live leaderboard fan-out for SSE subscribers
+leaderboard_broker = create_leaderboard_broker(db.challenges.delegate)
+
+# Serialized challenges, keyed by challenge version
+challenge_json_cache = ChallengeJSONCache()
+
+# Guesses being worked on right now, reported at /api/metrics/in_flight
+guess_gauge = InFlightGauge()
+
+# Configuration
+app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+
+def json_response(body: bytes, compressible: bool = False, status: int = 200):
+    body, headers = encode_response(body, request.headers.get('Accept-Encoding'), compressible)
+    return Response(body, status=status, headers=headers)
+
+async def run_clip(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(clip_executor, func, *args)
+
+@app.before_serving
+async def startup():
+    await db.init_indexes()
+    stats_buffer.start()
+    leaderboard_broker.start()
+
+@app.after_serving
+async def shutdown():
+    clip_executor.shutdown(wait=False)
+    leaderboard_broker.stop()
+    # Flush buffered stats off the event loop
+    await asyncio.get_running_loop().run_in_executor(None, stats_buffer.stop)
+
+@app.before_request
+async def track_guess_start():
+    if request.endpoint == 'submit_guess':
+        guess_gauge.enter()
+
+@app.teardown_request
+async def track_guess_end(exc=None):
+    if request.endpoint == 'submit_guess':
+        guess_gauge.exit()
+
+# -------------------------------
+# Authentication endpoints
+# -------------------------------
+@app.route('/api/auth/register', methods=['POST'])
+async def register():
+    try:
+        data = await request.get_json()
+        username = data.get('username')
+        password = data.get('password')
+
+        if not all([username, password]):
+            return jsonify({'error': 'Missing required fields'}), 400
+
+        # Hashing the password with bcrypt is CPU-bound
+        loop = asyncio.get_running_loop()
+        user = await loop.run_in_executor(None, lambda: User(username=username, password=password))
+        user_id = await db.save_user(user)
+
+        return jsonify({
+            'message': 'User registered successfully',
+            'user_id': user_id
+        }), 201
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/auth/login', methods=['POST'])
+async def login():
+    try:
+        data = await request.get_json()
+        username = data.get('username')
+        password = data.get('password')
+
+        if not all([username, password]):
+            return jsonify({'error': 'Missing required fields'}), 400
+
+        user = await db.authenticate_user(username, password)
+        if not user:
+            return jsonify({'error': 'Invalid credentials'}), 401
+
+        return jsonify({
+            'message': 'Login successful',
+            'user_id': user._id
+        })
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# -------------------------------
+# User endpoints
+# -------------------------------
+@app.route('/api/users/<user_id>/stats', methods=['GET'])
+async def get_user_stats(user_id):
+    try:
+        stats = await db.get_user_stats(user_id)
+        if stats is None:
+            return jsonify({'error': 'User not found'}), 404
+        # Include increments that are still buffered in this process
+        return jsonify(stats_buffer.merge_pending(user_id, stats))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# -------------------------------
+# Global leaderboard endpoints
+# -------------------------------
+@app.route('/api/leaderboard', methods=['GET'])
+async def get_global_leaderboard():
+    try:
+        page = request.args.get('page', 1, type=int)
+        page_size = request.args.get('page_size', 20, type=int)
+        leaderboard = await db.get_global_leaderboard(page, page_size)
+        return json_response(dumps(leaderboard), compressible=True)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/leaderboard/users/<user_id>', methods=['GET'])
+async def get_global_rank(user_id):
+    try:
+        entry = await db.get_global_rank(user_id)
+        if not entry:
+            return jsonify({'error': 'User has no solves yet'}), 404
+        return jsonify(entry)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# -------------------------------
+# Metrics endpoints
+# -------------------------------
+@app.route('/api/metrics/in_flight', methods=['GET'])
+async def get_in_flight():
+    # ?reset=1 starts a new peak window, load_test.py does this before a run
+    return jsonify(guess_gauge.snapshot(reset=request.args.get('reset') == '1'))
+
+# -------------------------------
+# Challenge endpoints
+# -------------------------------
+
+@app.route('/api/challenges', methods=['POST'])
+async def create_challenge():
+    try:
+        # Get form data
+        form = await request.form
+        files = await request.files
+        user_id = form.get('user_id')
+        title = form.get('title')
+        description = form.get('description')
+        boundary = form.get('boundary')
+        photo = files.get('photo')
+
+        if not all([user_id, title, description, boundary, photo]):
+            return jsonify({'error': 'Missing required fields'}), 400
+
+        # Validate image
+        is_valid, error = validate_image(photo)
+        if not is_valid:
+            return jsonify({'error': error}), 400
+
+        # Save photo
+        filename = secure_filename(photo.filename)
+        photo_path = os.path.join('uploads', filename)
+        os.makedirs('uploads', exist_ok=True)
+        await photo.save(photo_path)
+
+        # Caption and riddle are independent, run them concurrently
+        caption, riddle = await asyncio.gather(
+            caption_service.generate_caption_async(photo_path, clip_executor),
+            gemini_service.generate_riddle_async(photo_path)
+        )
+
+        # prepend a riddle to description
+        description = description+'\n\n'+riddle
+
+        # Create challenge
+        challenge = Challenge(
+            user_id=user_id,
+            title=title,
+            description=description,
+            boundary=boundary,
+            photo_path=photo_path,
+            caption=caption,
+            caption_backend=caption_service.name
+        )
+
+        # Save to the database
+        challenge_id = await db.save_challenge(challenge)
+        stats_buffer.increment(user_id, challenges_created=1)
+
+        return jsonify({
+            'message': 'Challenge created successfully',
+            'challenge_id': str(challenge_id)
+        }), 201
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/challenges', methods=['GET'])
+async def get_challenges():
+    try:
+        # Full documents (embeddings included) are only loaded for cache misses
+        versions = await db.get_challenge_versions()
+        hits, missing = challenge_json_cache.lookup(versions)
+        loaded = await db.get_challenges_by_ids(missing)
+        return json_response(challenge_json_cache.dumps_list(versions, hits, loaded), compressible=True)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/challenges/<challenge_id>/guess', methods=['POST'])
+async def submit_guess(challenge_id):
+    try:
+        form = await request.form
+        files = await request.files
+        user_id = form.get('user_id')
+        username = form.get('username')
+        photo = files.get('photo')
+        guess_count = int(form.get('guess_count', 1))
+
+        if not all([user_id, photo]):
+            return jsonify({'error': 'Missing required fields'}), 400
+
+        # Validate image
+        is_valid, error = validate_image(photo)
+        if not is_valid:
+            return jsonify({'error': error}), 400
+
+        # Retrieve challenge from DB
+        challenge = await db.get_challenge(challenge_id)
+        if not challenge:
+            return jsonify({'error': 'Challenge not found'}), 404
+
+        # Save guess photo
+        filename = secure_filename(photo.filename)
+        guess_photo_path = os.path.join('uploads', f'guess_{filename}')
+        await photo.save(guess_photo_path)
+
+        answer_caption = challenge.caption
+
+        # Captioning overlaps with CLIP image work
+        guess_caption, img_similarity_score, match = await asyncio.gather(
+            caption_service.generate_caption_async(guess_photo_path, clip_executor),
+            run_clip(embedding_service.img_similarity, guess_photo_path, challenge.photo_path),
+            run_clip(embedding_service.object_match, guess_photo_path, answer_caption)
+        )
+
+        # Calculate similarities
+        text_similarity_score = await run_clip(embedding_service.caption_similarity, guess_caption, answer_caption)
+        metric_similarity = embedding_service.metric_similarity(img_similarity_score, text_similarity_score)
+
+        # Determine if guess is correct
+        is_correct = embedding_service.decision_threshold(match, metric_similarity)
+
+        if is_correct:
+            # Update leaderboard if guess is correct
+            solve = await db.update_leaderboard(challenge_id, user_id, username, guess_count)
+            if solve:
+                leaderboard_broker.publish(challenge_id, {'type': solve, 'entry': {
+                    'user_id': user_id,
+                    'username': username,
+                    'guess_count': guess_count
+                }})
+            # Only a first solve of this challenge counts towards challenges_solved
+            stats_buffer.increment(user_id, total_guesses=1, challenges_solved=1 if solve == 'added' else 0)
+            feedback = "Congratulations! You've solved the challenge!"
+        else:
+            # Generate a hint using the Gemini service
+            stats_buffer.increment(user_id, total_guesses=1)
+            feedback = await gemini_service.generate_hint_async(challenge.photo_path, guess_photo_path)
+
+        return jsonify({
+            'correct': is_correct,
+            'feedback': feedback,
+            'similarity': float(metric_similarity)
+        })
+
+    except Exception as e:
+        print(str(e))
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/challenges/<challenge_id>/leaderboard', methods=['GET'])
+async def get_leaderboard(challenge_id):
+    try:
+        leaderboard = await db.get_leaderboard(challenge_id)
+        return json_response(dumps(leaderboard), compressible=True)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/challenges/<challenge_id>/leaderboard/stream', methods=['GET'])
+async def stream_leaderboard(challenge_id):
+    """
+    Server-Sent Events stream of a challenge leaderboard: a 'snapshot' event
+    first, then 'added'/'improved' deltas keyed by user_id. A new snapshot is
+    sent whenever this subscriber fell behind.
+    """
+    try:
+        subscription = leaderboard_broker.subscribe(challenge_id, asynchronous=True)
+    except TooManySubscribers as e:
+        return jsonify({'error': str(e)}), 503
+
+    async def events():
+        try:
+            # Subscribed before the snapshot is read, so no change is missed
+            yield format_sse('snapshot', await db.get_leaderboard(challenge_id))
+            while True:
+                event = await subscription.get(HEARTBEAT_INTERVAL)
+                if event is None:
+                    yield HEARTBEAT
+                elif event['type'] == 'resync':
+                    yield format_sse('snapshot', await db.get_leaderboard(challenge_id))
+                else:
+                    yield format_sse(event['type'], event['entry'])
+        finally:
+            leaderboard_broker.unsubscribe(subscription)
+
+    response = Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # Streams stay open indefinitely
+    response.timeout = None
+    return response
+
+@app.route('/api/challenges/<challenge_id>', methods=['GET'])
+async def get_challenge(challenge_id):
+    """
+    Retrieves a single challenge by its ID.
+    """
+    try:
+        challenge = await db.get_challenge(challenge_id)
+        if not challenge:
+            return jsonify({'error': 'Challenge not found'}), 404
+        return json_response(challenge_json_cache.get(challenge))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+if __name__ == '__main__':
+    app.run(debug=True)
@@ -0,0 +1,226 @@
+from motor.motor_asyncio import AsyncIOMotorClient
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import os
+from models.challenge import Challenge
+from models.user import User
+from database import global_leaderboard
+from bson import ObjectId
+
+def _verify_user(user_data: Dict, password: str) -> Optional[User]:
+    user = User.from_dict(user_data)
+    return user if user.verify_password(password) else None
+
+class AsyncMongoDB:
+    """
+    Non-blocking counterpart of MongoDB, backed by motor. Used by async_app.py
+    so a request waiting on Mongo does not hold a worker thread.
+    """
+    def __init__(self):
+        self.client = AsyncIOMotorClient(os.getenv('MONGODB_URI'))
+        self.db = self.client['challenge_app']
+        self.challenges = self.db['challenges']
+        self.users = self.db['users']
+        self.global_leaderboard = self.db[global_leaderboard.COLLECTION_NAME]
+
+    async def init_indexes(self):
+        # motor cannot create indexes from __init__, call this on startup
+        await self.users.create_index('username', unique=True)
+        await self.global_leaderboard.create_index(global_leaderboard.RANK_SORT)
+
+    async def save_challenge(self, challenge: Challenge) -> str:
+        try:
+            # Embedding is packed as BSON binary (see utils/embedding_codec.py)
+            challenge_dict = challenge.to_document()
+            result = await self.challenges.insert_one(challenge_dict)
+            return str(result.inserted_id)
+        except Exception as e:
+            print(f"Error saving challenge: {str(e)}")
+            raise
+
+    async def get_challenge(self, challenge_id: str) -> Optional[Challenge]:
+        try:
+            challenge_data = await self.challenges.find_one({'_id': ObjectId(challenge_id)})
+            if challenge_data:
+                return Challenge.from_dict(challenge_data)
+            return None
+        except Exception as e:
+            print(f"Error getting challenge: {str(e)}")
+            return None
+
+    async def get_all_challenges(self) -> List[Challenge]:
+        try:
+            result = []
+            async for challenge in self.challenges.find():
+                result.append(Challenge.from_dict(challenge))
+            return result
+        except Exception as e:
+            print(f"Error getting all challenges: {str(e)}")
+            return []
+
+    async def get_challenge_versions(self) -> List[Tuple[str, int]]:
+        # Only _id and version, so listings can be served from the JSON cache
+        try:
+            return [(str(doc['_id']), doc.get('version', 0))
+                    async for doc in self.challenges.find({}, {'version': 1})]
+        except Exception as e:
+            print(f"Error getting challenge versions: {str(e)}")
+            return []
+
+    async def get_challenges_by_ids(self, challenge_ids: List[str]) -> List[Challenge]:
+        if not challenge_ids:
+            return []
+        try:
+            result = []
+            async for challenge in self.challenges.find({'_id': {'$in': [ObjectId(i) for i in challenge_ids]}}):
+                result.append(Challenge.from_dict(challenge))
+            return result
+        except Exception as e:
+            print(f"Error getting challenges: {str(e)}")
+            return []
+
+    async def update_leaderboard(self, challenge_id: str, user_id: str, username: str, guesses: int) -> Optional[str]:
+        # Returns 'added' for a first solve, 'improved' for a better score, else None
+        try:
+            challenge = await self.challenges.find_one(
+                {'_id': ObjectId(challenge_id)},
+                {'leaderboard': 1}
+            )
+            if not challenge:
+                print(f"Challenge with id {challenge_id} not found.")
+                return None
+
+            leaderboard = challenge.get('leaderboard') or []
+            # Find an existing entry for this user in the leaderboard
+            user_entry = next((entry for entry in leaderboard if entry.get('user_id') == user_id), None)
+
+            if user_entry:
+                # Update if the new score is better (i.e., lower guess count)
+                if guesses < user_entry.get('guess_count', float('inf')):
+                    previous = user_entry.get('guess_count')
+                    # Only apply if the entry still holds the score read above, so
+                    # concurrent improvements cannot both count
+                    result = await self.challenges.update_one(
+                        {'_id': ObjectId(challenge_id), 'leaderboard': {'$elemMatch': {'user_id': user_id, 'guess_count': previous}}},
+                        {'$set': {
+                            'leaderboard.$.guess_count': guesses,
+                            'leaderboard.$.username': username
+                        }, '$inc': {'version': 1}}
+                    )
+                    if result.modified_count != 1:
+                        return None
+                    await self._record_global_solve(user_id, username, 0, guesses - (previous or 0))
+                    return 'improved'
+                return None
+            else:
+                # $push creates the leaderboard array if it is missing
+                # The filter skips the push if a concurrent request already added this user
+                result = await self.challenges.update_one(
+                    {'_id': ObjectId(challenge_id), 'leaderboard.user_id': {'$ne': user_id}},
+                    {'$push': {'leaderboard': {
+                        'user_id': user_id,
+                        'username': username,
+                        'guess_count': guesses
+                    }}, '$inc': {'version': 1}}
+                )
+                if result.modified_count != 1:
+                    return None
+                await self._record_global_solve(user_id, username, 1, guesses)
+                return 'added'
+        except Exception as e:
+            print(f"Error updating leaderboard: {str(e)}")
+            return None
+
+    async def _record_global_solve(self, user_id: str, username: str, solves_delta: int, guesses_delta: int):
+        # Incrementally keep the global leaderboard in step with a challenge leaderboard change
+        try:
+            await self.global_leaderboard.update_one(
+                {'_id': user_id},
+                global_leaderboard.solve_update(username, solves_delta, guesses_delta),
+                upsert=True
+            )
+        except Exception as e:
+            print(f"Error updating global leaderboard: {str(e)}")
+
+    async def get_global_leaderboard(self, page: int = 1, page_size: int = 20) -> List[Dict]:
+        try:
+            skip, limit = global_leaderboard.page_bounds(page, page_size)
+            cursor = self.global_leaderboard.find().sort(global_leaderboard.RANK_SORT).skip(skip).limit(limit)
+            docs = await cursor.to_list(length=limit)
+            return [global_leaderboard.format_entry(doc, skip + i + 1) for i, doc in enumerate(docs)]
+        except Exception as e:
+            print(f"Error getting global leaderboard: {str(e)}")
+            return []
+
+    async def get_global_rank(self, user_id: str) -> Optional[Dict]:
+        try:
+            entry = await self.global_leaderboard.find_one({'_id': user_id})
+            if not entry:
+                return None
+            rank = await self.global_leaderboard.count_documents(global_leaderboard.ranked_above(entry)) + 1
+            return global_leaderboard.format_entry(entry, rank)
+        except Exception as e:
+            print(f"Error getting global rank: {str(e)}")
+            return None
+
+    async def get_leaderboard(self, challenge_id: str) -> List[Dict]:
+        try:
+            challenge = await self.challenges.find_one(
+                {'_id': ObjectId(challenge_id)},
+                {'leaderboard': 1}
+            )
+            if not challenge:
+                return []
+
+            leaderboard = challenge.get('leaderboard') or []
+            # Sort by number of guesses (ascending)
+            leaderboard.sort(key=lambda x: x['guess_count'])
+            return leaderboard
+        except Exception as e:
+            print(f"Error getting leaderboard: {str(e)}")
+            return []
+
+    async def save_user(self, user: User) -> str:
+        try:
+            user_dict = user.to_dict()
+            if '_id' in user_dict:
+                del user_dict['_id']  # Remove _id if it exists to let MongoDB generate a new one
+            result = await self.users.insert_one(user_dict)
+            return str(result.inserted_id)
+        except Exception as e:
+            if 'duplicate key error' in str(e):
+                raise ValueError("Username already exists")
+            raise e
+
+    async def get_user(self, user_id: str) -> Optional[User]:
+        try:
+            user_data = await self.users.find_one({'_id': ObjectId(user_id)})
+            if user_data:
+                return User.from_dict(user_data)
+            return None
+        except Exception as e:
+            print(f"Error getting user: {str(e)}")
+            return None
+
+    async def get_user_stats(self, user_id: str) -> Optional[Dict]:
+        # Projects only the stats so the password hash is never loaded
+        try:
+            user_data = await self.users.find_one({'_id': ObjectId(user_id)}, {'stats': 1})
+            if user_data:
+                return user_data.get('stats') or {}
+            return None
+        except Exception as e:
+            print(f"Error getting user stats: {str(e)}")
+            return None
+
+    async def authenticate_user(self, username: str, password: str) -> Optional[User]:
+        try:
+            user_data = await self.users.find_one({'username': username})
+            if user_data:
+                # bcrypt is CPU-bound, keep it off the event loop
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(None, _verify_user, user_data, password)
+            return None
+        except Exception as e:
+            print(f"Error authenticating user: {str(e)}")
+            return None
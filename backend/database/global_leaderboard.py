@@ -0,0 +1,78 @@
+"""
+Query and update definitions for the materialized global leaderboard, shared
+by MongoDB and AsyncMongoDB.
+
+One document per user in the `global_leaderboard` collection:
+    {'_id': user_id, 'username': str, 'solves': int,
+     'total_guesses': int, 'avg_guesses': float}
+
+Ranking: most solves first, then fewest average guesses per solve, then
+user id as a stable tie-breaker.
+"""
+from typing import Any, Dict, List
+
+COLLECTION_NAME = 'global_leaderboard'
+RANK_SORT = [('solves', -1), ('avg_guesses', 1), ('_id', 1)]
+MAX_PAGE_SIZE = 100
+
+def solve_update(username: str, solves_delta: int, guesses_delta: int) -> List[Dict[str, Any]]:
+    """
+    Update pipeline applying one recorded or improved solve. Used with
+    upsert=True so the first solve creates the user's entry.
+    """
+    return [
+        {'$set': {
+            # Client input: $literal keeps a leading '$' from being read as a field path
+            'username': {'$literal': username},
+            'solves': {'$add': [{'$ifNull': ['$solves', 0]}, solves_delta]},
+            'total_guesses': {'$add': [{'$ifNull': ['$total_guesses', 0]}, guesses_delta]}
+        }},
+        {'$set': {
+            'avg_guesses': {'$cond': [
+                {'$gt': ['$solves', 0]},
+                {'$divide': ['$total_guesses', '$solves']},
+                None
+            ]}
+        }}
+    ]
+
+def ranked_above(entry: Dict[str, Any]) -> Dict[str, Any]:
+    # Every entry ordered before `entry` under RANK_SORT; counted on the index
+    return {'$or': [
+        {'solves': {'$gt': entry['solves']}},
+        {'solves': entry['solves'], 'avg_guesses': {'$lt': entry['avg_guesses']}},
+        {'solves': entry['solves'], 'avg_guesses': entry['avg_guesses'], '_id': {'$lt': entry['_id']}}
+    ]}
+
+def rebuild_pipeline() -> List[Dict[str, Any]]:
+    """
+    Aggregation over the challenges collection that recomputes every entry
+    from the per-challenge leaderboards and replaces the collection with $out
+    (existing indexes are kept).
+    """
+    return [
+        {'$unwind': '$leaderboard'},
+        {'$group': {
+            '_id': '$leaderboard.user_id',
+            'username': {'$last': '$leaderboard.username'},
+            'solves': {'$sum': 1},
+            'total_guesses': {'$sum': '$leaderboard.guess_count'}
+        }},
+        {'$set': {'avg_guesses': {'$divide': ['$total_guesses', '$solves']}}},
+        {'$out': COLLECTION_NAME}
+    ]
+
+def page_bounds(page: int, page_size: int) -> tuple[int, int]:
+    page = max(page, 1)
+    page_size = min(max(page_size, 1), MAX_PAGE_SIZE)
+    return (page - 1) * page_size, page_size
+
+def format_entry(doc: Dict[str, Any], rank: int) -> Dict[str, Any]:
+    return {
+        'rank': rank,
+        'user_id': doc['_id'],
+        'username': doc.get('username'),
+        'solves': doc.get('solves', 0),
+        'total_guesses': doc.get('total_guesses', 0),
+        'avg_guesses': doc.get('avg_guesses')
+    }
@@ -1,12 +1,12 @@
 from pymongo import MongoClient
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import os
 from models.challenge import Challenge
 from models.user import User
+from database import global_leaderboard
 from bson import ObjectId
 from datetime import datetime
 from typing import Dict, List
-import numpy as np
 
 class MongoDB:
     def __init__(self):
@@ -14,19 +14,15 @@ class MongoDB:
         self.db = self.client['challenge_app']
         self.challenges = self.db['challenges']
         self.users = self.db['users']
+        self.global_leaderboard = self.db[global_leaderboard.COLLECTION_NAME]
         
         self.users.create_index('username', unique=True)
+        self.global_leaderboard.create_index(global_leaderboard.RANK_SORT)
         
     def save_challenge(self, challenge: Challenge) -> str:
         try:
-            challenge_dict = challenge.to_dict()
-            # Ensure embedding is properly converted to list
-            if challenge_dict.get('embedding') is not None:
-                if isinstance(challenge_dict['embedding'], np.ndarray):
-                    challenge_dict['embedding'] = challenge_dict['embedding'].tolist()
-                elif not isinstance(challenge_dict['embedding'], list):
-                    print("Warning: embedding is not in expected format")
-                    challenge_dict['embedding'] = None
+            # Embedding is packed as BSON binary (see utils/embedding_codec.py)
+            challenge_dict = challenge.to_document()
             result = self.challenges.insert_one(challenge_dict)
             return str(result.inserted_id)
         except Exception as e:
@@ -37,13 +33,7 @@ class MongoDB:
         try:
             challenge_data = self.challenges.find_one({'_id': ObjectId(challenge_id)})
             if challenge_data:
-                # Ensure embedding is properly converted to numpy array
-                if challenge_data.get('embedding') is not None:
-                    try:
-                        challenge_data['embedding'] = np.array(challenge_data['embedding'])
-                    except Exception as e:
-                        print(f"Error converting embedding: {str(e)}")
-                        challenge_data['embedding'] = None
+                # Challenge.from_dict decodes the embedding
                 return Challenge.from_dict(challenge_data)
             return None
         except Exception as e:
@@ -55,26 +45,39 @@ class MongoDB:
             challenges = self.challenges.find()
             result = []
             for challenge in challenges:
-                # Ensure embedding is properly converted to numpy array
-                if challenge.get('embedding') is not None:
-                    try:
-                        challenge['embedding'] = np.array(challenge['embedding'])
-                    except Exception as e:
-                        print(f"Error converting embedding: {str(e)}")
-                        challenge['embedding'] = None
                 result.append(Challenge.from_dict(challenge))
             return result
         except Exception as e:
             print(f"Error getting all challenges: {str(e)}")
             return []
         
-    def update_leaderboard(self, challenge_id: str, user_id: str, username: str, guesses: int):
+    def get_challenge_versions(self) -> List[Tuple[str, int]]:
+        # Only _id and version, so listings can be served from the JSON cache
+        try:
+            return [(str(doc['_id']), doc.get('version', 0))
+                    for doc in self.challenges.find({}, {'version': 1})]
+        except Exception as e:
+            print(f"Error getting challenge versions: {str(e)}")
+            return []
+
+    def get_challenges_by_ids(self, challenge_ids: List[str]) -> List[Challenge]:
+        if not challenge_ids:
+            return []
+        try:
+            challenges = self.challenges.find({'_id': {'$in': [ObjectId(i) for i in challenge_ids]}})
+            return [Challenge.from_dict(challenge) for challenge in challenges]
+        except Exception as e:
+            print(f"Error getting challenges: {str(e)}")
+            return []
+
+    def update_leaderboard(self, challenge_id: str, user_id: str, username: str, guesses: int) -> Optional[str]:
+        # Returns 'added' for a first solve, 'improved' for a better score, else None
         try:
             # Find the challenge document by its ObjectId
             challenge = self.challenges.find_one({'_id': ObjectId(challenge_id)})
             if not challenge:
                 print(f"Challenge with id {challenge_id} not found.")
-                return
+                return None
             
             # Ensure that the leaderboard field exists and is a list
             if 'leaderboard' not in challenge or challenge['leaderboard'] is None:
@@ -91,30 +94,80 @@ class MongoDB:
             if user_entry:
                 # Update if the new score is better (i.e., lower guess count)
                 if guesses < user_entry.get('guess_count', float('inf')):
+                    previous = user_entry.get('guess_count')
+                    # Only apply if the entry still holds the score read above, so
+                    # concurrent improvements cannot both count
                     result = self.challenges.update_one(
-                        {'_id': ObjectId(challenge_id), 'leaderboard.user_id': user_id},
+                        {'_id': ObjectId(challenge_id), 'leaderboard': {'$elemMatch': {'user_id': user_id, 'guess_count': previous}}},
                         {'$set': {
                             'leaderboard.$.guess_count': guesses,
                             'leaderboard.$.username': username  # update username if necessary
-                        }}
+                        }, '$inc': {'version': 1}}
                     )
                     print(f"Leaderboard updated for user {user_id}: matched {result.matched_count}, modified {result.modified_count}")
+                    if result.modified_count != 1:
+                        return None
+                    self._record_global_solve(user_id, username, 0, guesses - (previous or 0))
+                    return 'improved'
                 else:
                     print("New guess count is not lower than the existing score; leaderboard not updated.")
+                    return None
             else:
                 # Add a new leaderboard entry for this user
+                # The filter skips the push if a concurrent request already added this user
                 result = self.challenges.update_one(
-                    {'_id': ObjectId(challenge_id)},
+                    {'_id': ObjectId(challenge_id), 'leaderboard.user_id': {'$ne': user_id}},
                     {'$push': {'leaderboard': {
                         'user_id': user_id,
                         'username': username,
                         'guess_count': guesses
-                    }}}
+                    }}, '$inc': {'version': 1}}
                 )
                 print(f"Added new leaderboard entry for user {user_id}: matched {result.matched_count}, modified {result.modified_count}")
+                if result.modified_count != 1:
+                    return None
+                self._record_global_solve(user_id, username, 1, guesses)
+                return 'added'
         except Exception as e:
             print(str(e))
             print(f"Error updating leaderboard: {str(e)}")
+            return None
+
+    def _record_global_solve(self, user_id: str, username: str, solves_delta: int, guesses_delta: int):
+        # Incrementally keep the global leaderboard in step with a challenge leaderboard change
+        try:
+            self.global_leaderboard.update_one(
+                {'_id': user_id},
+                global_leaderboard.solve_update(username, solves_delta, guesses_delta),
+                upsert=True
+            )
+        except Exception as e:
+            print(f"Error updating global leaderboard: {str(e)}")
+
+    def get_global_leaderboard(self, page: int = 1, page_size: int = 20) -> List[Dict]:
+        try:
+            skip, limit = global_leaderboard.page_bounds(page, page_size)
+            cursor = self.global_leaderboard.find().sort(global_leaderboard.RANK_SORT).skip(skip).limit(limit)
+            return [global_leaderboard.format_entry(doc, skip + i + 1) for i, doc in enumerate(cursor)]
+        except Exception as e:
+            print(f"Error getting global leaderboard: {str(e)}")
+            return []
+
+    def get_global_rank(self, user_id: str) -> Optional[Dict]:
+        try:
+            entry = self.global_leaderboard.find_one({'_id': user_id})
+            if not entry:
+                return None
+            rank = self.global_leaderboard.count_documents(global_leaderboard.ranked_above(entry)) + 1
+            return global_leaderboard.format_entry(entry, rank)
+        except Exception as e:
+            print(f"Error getting global rank: {str(e)}")
+            return None
+
+    def rebuild_global_leaderboard(self) -> int:
+        # Recomputes every entry from the per-challenge leaderboards
+        self.challenges.aggregate(global_leaderboard.rebuild_pipeline())
+        return self.global_leaderboard.count_documents({})
 
     def get_leaderboard(self, challenge_id: str) -> List[Dict]:
         try:
@@ -152,6 +205,17 @@ class MongoDB:
             print(f"Error getting user: {str(e)}")
             return None
         
+    def get_user_stats(self, user_id: str) -> Optional[Dict]:
+        # Projects only the stats so the password hash is never loaded
+        try:
+            user_data = self.users.find_one({'_id': ObjectId(user_id)}, {'stats': 1})
+            if user_data:
+                return user_data.get('stats') or {}
+            return None
+        except Exception as e:
+            print(f"Error getting user stats: {str(e)}")
+            return None
+        
     def get_user_by_username(self, username: str) -> Optional[User]:
         try:
             user_data = self.users.find_one({'username': username})
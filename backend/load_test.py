@@ -0,0 +1,115 @@
+"""
+Load test for the guess endpoint. Compares how many guesses app.py and
+async_app.py (each with a single worker) keep in flight at the same time, as
+counted by the server at /api/metrics/in_flight.
+
+    python load_test.py --compare http://localhost:5000 http://localhost:8000 \
+        --challenge <id> --user <id> --photo uploads/download_3.png \
+        --concurrency 32 --requests 128
+
+Use --url instead of --compare to measure a single server.
+"""
+import argparse
+import asyncio
+import os
+import time
+import httpx
+
+class InFlightCounter:
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+
+    def __enter__(self):
+        self.current += 1
+        self.peak = max(self.peak, self.current)
+        return self
+
+    def __exit__(self, *exc):
+        self.current -= 1
+
+async def submit_guess(client, url, args, photo_bytes, counter, latencies, errors):
+    files = {'photo': (os.path.basename(args.photo), photo_bytes, 'image/png')}
+    data = {'user_id': args.user, 'username': 'loadtest', 'guess_count': '1'}
+    start = time.perf_counter()
+    with counter:
+        try:
+            response = await client.post(f'{url}/api/challenges/{args.challenge}/guess', data=data, files=files)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(str(e))
+    latencies.append(time.perf_counter() - start)
+
+async def server_in_flight(client, url, reset=False):
+    # Peak concurrent guesses as counted by the server itself
+    try:
+        response = await client.get(f'{url}/api/metrics/in_flight', params={'reset': '1'} if reset else None)
+        if response.status_code == 200:
+            return response.json()
+    except httpx.HTTPError:
+        pass
+    return None
+
+async def measure(url, args, photo_bytes):
+    counter = InFlightCounter()
+    latencies, errors = [], []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def worker(client):
+        async with semaphore:
+            await submit_guess(client, url, args, photo_bytes, counter, latencies, errors)
+
+    limits = httpx.Limits(max_connections=args.concurrency + 1)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        # A single warm request gives the unloaded service time
+        await submit_guess(client, url, args, photo_bytes, counter, [], errors)
+        solo_start = time.perf_counter()
+        await submit_guess(client, url, args, photo_bytes, counter, [], errors)
+        solo_latency = time.perf_counter() - solo_start
+        errors.clear()
+        counter.peak = 0
+
+        await server_in_flight(client, url, reset=True)
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(args.requests)))
+        elapsed = time.perf_counter() - start
+        server = await server_in_flight(client, url)
+
+    latencies.sort()
+    return {
+        'target': url,
+        'requests': f"{args.requests} ({len(errors)} errors)",
+        'elapsed': f"{elapsed:.2f}s",
+        'throughput': f"{args.requests / elapsed:.2f} req/s",
+        'latency p50/p95': f"{latencies[len(latencies) // 2]:.2f}s / {latencies[int(len(latencies) * 0.95) - 1]:.2f}s",
+        'solo latency': f"{solo_latency:.2f}s",
+        'server in flight': str(server['peak']) if server else 'n/a',
+        'client in flight': str(counter.peak)
+    }
+
+def report(results):
+    # One column per target, so --compare reads side by side
+    width = max(len(value) for result in results for value in result.values()) + 2
+    for label in results[0]:
+        print(f"{label + ':':<18}" + ''.join(f"{result[label]:<{width}}" for result in results))
+
+async def run(args):
+    with open(args.photo, 'rb') as f:
+        photo_bytes = f.read()
+    # Targets are measured one after the other so they do not compete for the box
+    results = [await measure(url, args, photo_bytes) for url in (args.compare or [args.url])]
+    report(results)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Concurrent guess load test')
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--compare', nargs=2, metavar=('URL1', 'URL2'),
+                        help='run against both servers and print the results side by side')
+    parser.add_argument('--challenge', required=True)
+    parser.add_argument('--user', required=True)
+    parser.add_argument('--photo', required=True)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=128)
+    parser.add_argument('--timeout', type=float, default=120.0)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,49 @@
+"""
+Rewrites challenge embeddings stored as BSON arrays of doubles into the packed
+binary format from utils/embedding_codec.py. Safe to re-run: documents that
+are already migrated are not matched.
+
+    python -m migrations.binary_embeddings [--dtype float16] [--batch-size 500] [--dry-run]
+"""
+import argparse
+import os
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+from utils.embedding_codec import SUPPORTED_DTYPES, decode_embedding, encode_embedding
+
+def migrate(challenges, dtype: str, batch_size: int, dry_run: bool = False) -> int:
+    # Only legacy documents hold the embedding as an array
+    cursor = challenges.find({'embedding': {'$type': 'array'}}, {'embedding': 1})
+    migrated = 0
+    operations = []
+    for doc in cursor:
+        encoded = encode_embedding(decode_embedding(doc['embedding']), dtype)
+        # Match on the array type again so a concurrent writer is not overwritten
+        operations.append(UpdateOne(
+            {'_id': doc['_id'], 'embedding': {'$type': 'array'}},
+            {'$set': {'embedding': encoded}}
+        ))
+        if len(operations) >= batch_size:
+            migrated += flush(challenges, operations, dry_run)
+            operations = []
+    if operations:
+        migrated += flush(challenges, operations, dry_run)
+    return migrated
+
+def flush(challenges, operations, dry_run: bool) -> int:
+    if dry_run:
+        return len(operations)
+    result = challenges.bulk_write(operations, ordered=False)
+    return result.modified_count
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Migrate challenge embeddings to BSON binary')
+    parser.add_argument('--dtype', choices=sorted(SUPPORTED_DTYPES), default='float32')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    load_dotenv()
+    client = MongoClient(os.getenv('MONGODB_URI'))
+    count = migrate(client['challenge_app']['challenges'], args.dtype, args.batch_size, args.dry_run)
+    print(f"{'Would migrate' if args.dry_run else 'Migrated'} {count} challenge embeddings")
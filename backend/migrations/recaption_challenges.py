@@ -0,0 +1,63 @@
+"""
+Re-captions stored challenges with the configured CAPTION_BACKEND. Guess
+captions are scored against the stored answer caption, so both must come from
+the same model; run this before switching backends. Challenges already
+captioned by the configured backend are skipped, so it is safe to re-run.
+
+    CAPTION_BACKEND=local python -m migrations.recaption_challenges [--batch-size 16] [--dry-run]
+"""
+import argparse
+import os
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+from services.caption_service import create_caption_service
+from services.gemini_service import GeminiService
+
+def recaption(challenges, caption_service, batch_size: int, dry_run: bool = False) -> int:
+    current = [caption_service.name]
+    if caption_service.name == 'gemini':
+        # Challenges created before caption_backend was recorded were captioned by Gemini
+        current.append(None)
+    query = {'caption_backend': {'$nin': current}}
+    cursor = challenges.find(query, {'photo_path': 1})
+    migrated = 0
+    batch = []
+    for doc in cursor:
+        if not doc.get('photo_path') or not os.path.exists(doc['photo_path']):
+            print(f"Skipping challenge {doc['_id']}: photo not found")
+            continue
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            migrated += flush(challenges, caption_service, batch, dry_run)
+            batch = []
+    if batch:
+        migrated += flush(challenges, caption_service, batch, dry_run)
+    return migrated
+
+def flush(challenges, caption_service, batch, dry_run: bool) -> int:
+    if dry_run:
+        return len(batch)
+    captions = caption_service.generate_captions([doc['photo_path'] for doc in batch])
+    operations = [
+        UpdateOne(
+            {'_id': doc['_id']},
+            {'$set': {'caption': caption, 'caption_backend': caption_service.name}, '$inc': {'version': 1}}
+        )
+        for doc, caption in zip(batch, captions)
+    ]
+    return challenges.bulk_write(operations, ordered=False).modified_count
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Re-caption challenges with the configured caption backend')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    load_dotenv()
+    gemini_service = None
+    if os.getenv('CAPTION_BACKEND', 'gemini').lower() == 'gemini':
+        gemini_service = GeminiService()
+    caption_service = create_caption_service(gemini_service)
+    client = MongoClient(os.getenv('MONGODB_URI'))
+    count = recaption(client['challenge_app']['challenges'], caption_service, args.batch_size, args.dry_run)
+    print(f"{'Would re-caption' if args.dry_run else 'Re-captioned'} {count} challenges with {caption_service.name}")
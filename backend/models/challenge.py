@@ -2,9 +2,11 @@ from datetime import datetime
 from typing import List, Dict, Any, Optional
 import json
 import numpy as np
+import orjson
 from sqlalchemy import Column, Integer, String, ForeignKey, Text, LargeBinary
 from sqlalchemy.orm import relationship
 import math  # Added for checking finiteness
+from utils.embedding_codec import decode_embedding, encode_embedding
 
 class Challenge:
     __tablename__ = "challenges"
@@ -29,7 +31,8 @@ class Challenge:
         boundary: str,
         photo_path: Optional[str] = None,
         embedding: Optional[np.ndarray] = None,
-        caption: Optional[str] = None
+        caption: Optional[str] = None,
+        caption_backend: Optional[str] = None
     ):
         self.user_id = user_id
         self.title = title
@@ -38,10 +41,31 @@ class Challenge:
         self.photo_path = photo_path
         self.embedding = embedding
         self.caption = caption
+        self.caption_backend = caption_backend  # Which CaptionService wrote the caption
         self.created_at = datetime.utcnow()
         self.leaderboard = []  # List of {'user_id': str, 'username': str, 'guesses': int}
+        self.version = 0
 
     def to_dict(self) -> Dict[str, Any]:
+        result = self._base_dict()
+        result["embedding"] = embedding_to_list(self.embedding)
+        return result
+
+    def to_document(self) -> Dict[str, Any]:
+        # Same as to_dict, but the embedding is stored as packed binary
+        result = self._base_dict()
+        result["embedding"] = encode_embedding(self.embedding)
+        return result
+
+    def to_api_dict(self) -> Dict[str, Any]:
+        # For utils.serialization: orjson writes the ndarray natively (NaN as
+        # null) and the boundary string is spliced in without re-parsing it
+        result = self._base_dict(parse_boundary=False)
+        result["boundary"] = orjson.Fragment(self.boundary) if self.boundary else None
+        result["embedding"] = self.embedding if isinstance(self.embedding, np.ndarray) else None
+        return result
+
+    def _base_dict(self, parse_boundary: bool = True) -> Dict[str, Any]:
         return {
             "id": str(getattr(self, '_id', '')),
             "user_id": self.user_id,
@@ -49,25 +73,23 @@ class Challenge:
             "description": self.description,
             "photo_path": self.photo_path,
             # Boundary is stored as a JSON string; return it as an object.
-            "boundary": json.loads(self.boundary) if self.boundary else None,
-            # Update embedding: first convert NumPy array to list,
-            # then sanitize the numbers (replace non-finite values with None).
-            "embedding": sanitize_numeric(self.embedding.tolist()) if isinstance(self.embedding, np.ndarray) else None,
+            "boundary": json.loads(self.boundary) if self.boundary and parse_boundary else None,
             "caption": self.caption,
+            "caption_backend": getattr(self, 'caption_backend', None),
             "created_at": self.created_at.isoformat() if hasattr(self, 'created_at') else None,
-            "leaderboard": getattr(self, 'leaderboard', [])
+            "leaderboard": getattr(self, 'leaderboard', []),
+            # Bumped on every write; used to key cached serializations
+            "version": getattr(self, 'version', 0)
         }
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'Challenge':
-        # Convert embedding from list to numpy array if it exists
-        embedding = None
-        if data.get('embedding') is not None:
-            try:
-                embedding = np.array(data['embedding'], dtype=np.float32)
-            except Exception as e:
-                print(f"Error converting embedding: {str(e)}")
-                embedding = None
+        # Decode the stored embedding (binary or legacy list) into a numpy array
+        try:
+            embedding = decode_embedding(data.get('embedding'))
+        except Exception as e:
+            print(f"Error converting embedding: {str(e)}")
+            embedding = None
 
         challenge = cls(
             user_id=str(data['user_id']),
@@ -76,7 +98,8 @@ class Challenge:
             boundary=json.dumps(data.get('boundary', {})),
             photo_path=data.get('photo_path'),
             embedding=embedding,
-            caption=data.get('caption')
+            caption=data.get('caption'),
+            caption_backend=data.get('caption_backend')
         )
         challenge._id = data.get('_id')
         if 'created_at' in data and data['created_at']:
@@ -84,8 +107,23 @@ class Challenge:
         else:
             challenge.created_at = datetime.utcnow()
         challenge.leaderboard = data.get('leaderboard', [])
+        challenge.version = data.get('version', 0)
         return challenge
 
+def embedding_to_list(embedding: Optional[np.ndarray]) -> Optional[List]:
+    """
+    Converts an embedding to a JSON-friendly list, replacing non-finite
+    values with None in one vectorized pass.
+    """
+    if not isinstance(embedding, np.ndarray):
+        return None
+    finite = np.isfinite(embedding)
+    if finite.all():
+        return embedding.tolist()
+    values = embedding.astype(object)
+    values[~finite] = None
+    return values.tolist()
+
 # Helper function to replace non-finite numbers with None
 def sanitize_numeric(value):
     """
@@ -0,0 +1,159 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from threading import Thread
+from typing import List, Tuple
+import asyncio
+import os
+import queue
+import time
+import torch
+from PIL import Image
+from transformers import BlipForConditionalGeneration, BlipProcessor
+
+caption_cache_dir = os.getenv('CAPTION_CACHE_DIR', "./caption_cache")
+DEFAULT_LOCAL_CAPTION_MODEL = "Salesforce/blip-image-captioning-base"
+MAX_CAPTION_TOKENS = 30
+
+class CaptionService(ABC):
+    """
+    Common caption interface. Backends implement caption_images; the other
+    methods are built on top of it. `name` is stored with each challenge
+    caption so captions written by another backend can be found and redone.
+    """
+    name = None
+
+    @abstractmethod
+    def caption_images(self, images: List[Image.Image]) -> List[str]:
+        pass
+
+    def caption_image(self, image: Image.Image) -> str:
+        return self.caption_images([image])[0]
+
+    def generate_caption(self, photo_path: str) -> str:
+        return self.caption_image(Image.open(photo_path).convert('RGB'))
+
+    def generate_captions(self, photo_paths: List[str]) -> List[str]:
+        images = [Image.open(path).convert('RGB') for path in photo_paths]
+        return self.caption_images(images)
+
+    async def generate_caption_async(self, photo_path: str, executor=None) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, self.generate_caption, photo_path)
+
+class CaptionBatcher:
+    """
+    Cross-request micro-batcher. Request threads submit single images; one
+    worker thread waits up to max_wait_ms for more to arrive and captions up
+    to batch_size of them in a single call.
+    """
+    def __init__(self, caption_images, batch_size: int, max_wait_ms: float):
+        self.caption_images = caption_images
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = Thread(target=self._run, name='caption-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, image: Image.Image) -> Future:
+        future = Future()
+        self._queue.put((image, future))
+        return future
+
+    def _next_batch(self) -> List[Tuple[Image.Image, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                captions = self.caption_images([image for image, _ in batch])
+                for (_, future), caption in zip(batch, captions):
+                    future.set_result(caption)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+class LocalCaptionService(CaptionService):
+    """
+    On-device image-to-text model loaded from a local cache directory. Runs on
+    CPU by default. Single captions from concurrent requests are coalesced by
+    a CaptionBatcher into one generate() call.
+    """
+    def __init__(self, model_name: str = None, batch_size: int = None):
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.model_name = model_name or os.getenv('CAPTION_MODEL', DEFAULT_LOCAL_CAPTION_MODEL)
+        self.name = f"local:{self.model_name}"
+        self.batch_size = batch_size or int(os.getenv('CAPTION_BATCH_SIZE', 8))
+        max_wait_ms = float(os.getenv('CAPTION_BATCH_WAIT_MS', 20))
+        self.processor = BlipProcessor.from_pretrained(self.model_name, cache_dir=caption_cache_dir)
+        self.model = BlipForConditionalGeneration.from_pretrained(self.model_name, cache_dir=caption_cache_dir)
+        self.model.to(self.device)
+        self.model.eval()
+        self.batcher = CaptionBatcher(self.caption_images, self.batch_size, max_wait_ms)
+
+    def caption_image(self, image: Image.Image) -> str:
+        return self.batcher.submit(image).result()
+
+    async def generate_caption_async(self, photo_path: str, executor=None) -> str:
+        # Decode in the executor, then wait on the batch without holding a thread
+        loop = asyncio.get_running_loop()
+        image = await loop.run_in_executor(executor, lambda: Image.open(photo_path).convert('RGB'))
+        return await asyncio.wrap_future(self.batcher.submit(image))
+
+    def caption_images(self, images: List[Image.Image]) -> List[str]:
+        captions = []
+        for start in range(0, len(images), self.batch_size):
+            batch = images[start:start + self.batch_size]
+            inputs = self.processor(images=batch, return_tensors="pt")
+            inputs = {k: v.to(self.device) for k, v in inputs.items()}
+            with torch.no_grad():
+                output_ids = self.model.generate(**inputs, max_new_tokens=MAX_CAPTION_TOKENS)
+            captions.extend(
+                caption.strip() for caption in self.processor.batch_decode(output_ids, skip_special_tokens=True)
+            )
+        return captions
+
+class GeminiCaptionService(CaptionService):
+    """
+    Remote captions through GeminiService. Kept for deployments without the
+    local model; each image is a separate API call.
+    """
+    name = 'gemini'
+
+    def __init__(self, gemini_service):
+        self.gemini_service = gemini_service
+
+    def caption_images(self, images: List[Image.Image]) -> List[str]:
+        return [self.gemini_service.caption_image(image) for image in images]
+
+    def caption_image(self, image: Image.Image) -> str:
+        return self.gemini_service.caption_image(image)
+
+    def generate_caption(self, photo_path: str) -> str:
+        return self.gemini_service.generate_caption(photo_path)
+
+    async def generate_caption_async(self, photo_path: str, executor=None) -> str:
+        return await self.gemini_service.generate_caption_async(photo_path)
+
+def create_caption_service(gemini_service=None) -> CaptionService:
+    # CAPTION_BACKEND selects the backend per deployment: "gemini" (default) or "local".
+    # Guess captions are compared with stored answer captions, so both must come
+    # from the same model: run migrations/recaption_challenges.py before switching.
+    backend = os.getenv('CAPTION_BACKEND', 'gemini').lower()
+    if backend == 'local':
+        return LocalCaptionService()
+    if backend == 'gemini':
+        if gemini_service is None:
+            raise ValueError("Gemini caption backend requires a GeminiService")
+        return GeminiCaptionService(gemini_service)
+    raise ValueError(f"Unknown CAPTION_BACKEND: {backend}")
@@ -4,16 +4,27 @@ from PIL import Image
 import numpy as np
 from transformers import CLIPProcessor, CLIPModel
 import os
+from services.inference_client import ClipSidecarClient
 
 cache_dir = "./clip_cache"
+MODEL_NAME = "openai/clip-vit-base-patch32"
 MAX_SEQUENCE_LENGTH = 77  # CLIP's maximum sequence length
 
 class EmbeddingService:
-    def __init__(self):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32", cache_dir=cache_dir)
-        self.processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32", cache_dir=cache_dir)
-        self.model.to(self.device)
+    def __init__(self, caption_service=None):
+        self.caption_service = caption_service
+        self.processor = CLIPProcessor.from_pretrained(MODEL_NAME, cache_dir=cache_dir)
+        if os.getenv('CLIP_BACKEND', 'local').lower() == 'sidecar':
+            # Inference runs in the sidecar process pool (services/inference_server.py),
+            # which puts the model on the GPU when there is one. Inputs stay on the
+            # CPU here because they are handed over through shared memory
+            self.device = "cpu"
+            self.model = ClipSidecarClient()
+            self.model.wait_until_ready()
+        else:
+            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+            self.model = CLIPModel.from_pretrained(MODEL_NAME, cache_dir=cache_dir)
+            self.model.to(self.device)
         
     def _truncate_text(self, text: str) -> str:
         # Tokenize the text
@@ -23,6 +34,11 @@ class EmbeddingService:
             truncated_tokens = tokens['input_ids'][0][:MAX_SEQUENCE_LENGTH]
             return self.processor.tokenizer.decode(truncated_tokens)
         return text
+
+    def _generate_caption(self, image: Image.Image) -> str:
+        if self.caption_service is None:
+            return None
+        return self.caption_service.caption_image(image)
         
     def process_image(self, image_file) -> tuple[np.ndarray, str]:
         # Load and preprocess image
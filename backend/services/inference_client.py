@@ -0,0 +1,147 @@
+from multiprocessing.shared_memory import SharedMemory
+from threading import Lock, local
+from typing import Any, Dict, Optional
+import atexit
+import os
+import socket
+import time
+import numpy as np
+import torch
+from services.inference_protocol import DEFAULT_SOCKET_PATH, align, recv_message, send_message
+
+class _Channel:
+    """
+    One connection and one reusable shared memory block per client thread.
+    """
+    def __init__(self, socket_path: str, timeout: float):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.sock = None
+        self.shm = None
+
+    def buffer(self, size: int) -> SharedMemory:
+        if self.shm is None or self.shm.size < size:
+            # Grow geometrically so batches of varying size do not reallocate each time
+            new_size = max(size, 2 * self.shm.size) if self.shm else size
+            self._release_shm()
+            self.shm = SharedMemory(create=True, size=new_size)
+        return self.shm
+
+    def request(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            if self.sock is None:
+                self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.sock.settimeout(self.timeout)
+                self.sock.connect(self.socket_path)
+            send_message(self.sock, message)
+            return recv_message(self.sock)
+        except (OSError, ConnectionError):
+            # Drop the connection so the next request reconnects. The block goes
+            # too: after a timeout the sidecar worker may still write its result
+            # into it, which would overwrite the next request's output
+            self.close()
+            raise
+
+    def release_buffer(self):
+        self._release_shm()
+
+    def close(self):
+        self._close_socket()
+        self._release_shm()
+
+    def _close_socket(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def _release_shm(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+class ClipSidecarClient:
+    """
+    Stands in for CLIPModel inside EmbeddingService: get_image_features and
+    get_text_features take the processor's tensors and return torch tensors,
+    but inference runs in the sidecar (services/inference_server.py).
+    """
+    def __init__(self, socket_path: str = None, timeout: float = None):
+        self.socket_path = socket_path or DEFAULT_SOCKET_PATH
+        self.timeout = timeout or float(os.getenv('CLIP_SIDECAR_TIMEOUT', 30.0))
+        self.embedding_dim = None
+        self._local = local()
+        self._channels = []
+        self._lock = Lock()
+        atexit.register(self.close)
+
+    def health(self) -> Dict[str, Any]:
+        response = self._channel().request({'op': 'health'})
+        if response.get('ok'):
+            self.embedding_dim = response['embedding_dim']
+        return response
+
+    def wait_until_ready(self, timeout: float = None):
+        # The sidecar may still be loading weights when the web worker starts
+        deadline = time.monotonic() + (timeout or float(os.getenv('CLIP_SIDECAR_STARTUP_TIMEOUT', 120.0)))
+        while True:
+            try:
+                if self.health().get('ok'):
+                    return
+            except (OSError, ConnectionError):
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"CLIP sidecar not reachable at {self.socket_path}")
+            time.sleep(1)
+
+    def get_image_features(self, pixel_values: torch.Tensor, **kwargs) -> torch.Tensor:
+        return self._features('image_features', {'pixel_values': pixel_values})
+
+    def get_text_features(self, input_ids: torch.Tensor, attention_mask: Optional[torch.Tensor] = None, **kwargs) -> torch.Tensor:
+        return self._features('text_features', {'input_ids': input_ids, 'attention_mask': attention_mask})
+
+    def close(self):
+        with self._lock:
+            for channel in self._channels:
+                channel.close()
+            self._channels = []
+
+    def _channel(self) -> _Channel:
+        channel = getattr(self._local, 'channel', None)
+        if channel is None:
+            channel = _Channel(self.socket_path, self.timeout)
+            self._local.channel = channel
+            with self._lock:
+                self._channels.append(channel)
+        return channel
+
+    def _features(self, op: str, tensors: Dict[str, Optional[torch.Tensor]]) -> torch.Tensor:
+        if self.embedding_dim is None:
+            health = self.health()
+            if self.embedding_dim is None:
+                raise RuntimeError(f"CLIP sidecar is not healthy: {health.get('error', 'no embedding dimension reported')}")
+        arrays = {name: np.ascontiguousarray(tensor.cpu().numpy()) for name, tensor in tensors.items() if tensor is not None}
+        batch = next(iter(arrays.values())).shape[0]
+
+        # Lay the inputs out back to back, followed by room for the result
+        inputs, offset = [], 0
+        for name, array in arrays.items():
+            inputs.append({'name': name, 'offset': offset, 'shape': list(array.shape), 'dtype': array.dtype.str})
+            offset = align(offset + array.nbytes)
+        output = {'offset': offset, 'shape': [batch, self.embedding_dim], 'dtype': np.dtype(np.float32).str}
+        size = offset + batch * self.embedding_dim * np.dtype(np.float32).itemsize
+
+        channel = self._channel()
+        shm = channel.buffer(size)
+        for spec, array in zip(inputs, arrays.values()):
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf, offset=spec['offset'])[...] = array
+
+        response = channel.request({'op': op, 'shm': shm.name, 'inputs': inputs, 'output': output})
+        if not response.get('ok'):
+            # Same as a transport error: never reuse a block a failed request handed out
+            channel.release_buffer()
+            raise RuntimeError(f"CLIP sidecar error: {response.get('error')}")
+
+        # Copy out of the block: it is reused by the next request on this thread
+        result = np.ndarray(response['shape'], dtype=np.float32, buffer=shm.buf, offset=offset).copy()
+        return torch.from_numpy(result)
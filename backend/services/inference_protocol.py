@@ -0,0 +1,56 @@
+"""
+Wire format shared by the CLIP inference sidecar and its client.
+
+Messages are a 4-byte big-endian length followed by a JSON header. Tensors
+never go over the socket: the client writes them into a shared memory block
+and the header only carries the block name plus (offset, shape, dtype) for
+each array.
+"""
+from typing import Any, Dict
+import json
+import os
+import socket
+import struct
+
+DEFAULT_SOCKET_PATH = os.getenv('CLIP_SOCKET', '/tmp/cruzhack-clip.sock')
+HEADER = struct.Struct('>I')
+MAX_MESSAGE_SIZE = 1024 * 1024
+# Keep every array in the block 64-byte aligned for the model's SIMD kernels
+ALIGNMENT = 64
+
+def align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def encode_message(message: Dict[str, Any]) -> bytes:
+    body = json.dumps(message).encode('utf-8')
+    return HEADER.pack(len(body)) + body
+
+def decode_length(header: bytes) -> int:
+    (length,) = HEADER.unpack(header)
+    if length > MAX_MESSAGE_SIZE:
+        raise ValueError(f"Message too large: {length} bytes")
+    return length
+
+def send_message(sock: socket.socket, message: Dict[str, Any]):
+    sock.sendall(encode_message(message))
+
+def recv_message(sock: socket.socket) -> Dict[str, Any]:
+    length = decode_length(_recv_exactly(sock, HEADER.size))
+    return json.loads(_recv_exactly(sock, length))
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Inference sidecar closed the connection")
+        data.extend(chunk)
+    return bytes(data)
+
+async def read_message(reader) -> Dict[str, Any]:
+    length = decode_length(await reader.readexactly(HEADER.size))
+    return json.loads(await reader.readexactly(length))
+
+async def write_message(writer, message: Dict[str, Any]):
+    writer.write(encode_message(message))
+    await writer.drain()
@@ -0,0 +1,191 @@
+"""
+CLIP inference sidecar. Runs the model in a dedicated process pool so web
+workers only preprocess inputs, and web concurrency and model compute can be
+scaled separately on the same box.
+
+    python -m services.inference_server --pool-size 2 --torch-threads 4
+
+Web workers connect over a Unix socket (services/inference_client.py) with
+EmbeddingService in CLIP_BACKEND=sidecar mode.
+"""
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, List
+import argparse
+import asyncio
+import os
+import numpy as np
+import torch
+from transformers import CLIPConfig, CLIPModel
+from services.embedding_service import MODEL_NAME, cache_dir
+from services.inference_protocol import DEFAULT_SOCKET_PATH, read_message, write_message
+
+MAX_ATTACHED_BLOCKS = 64
+HEALTH_TIMEOUT = 10.0
+
+# -------------------------------
+# Pool worker side
+# -------------------------------
+_model = None
+_device = "cpu"
+_attached = OrderedDict()
+
+def _init_worker(torch_threads: int, device: str):
+    global _model, _device
+    # Each pool process gets its own intra-op thread budget
+    torch.set_num_threads(torch_threads)
+    torch.set_num_interop_threads(1)
+    _device = device
+    _model = CLIPModel.from_pretrained(MODEL_NAME, cache_dir=cache_dir)
+    _model.to(_device)
+    _model.eval()
+
+def _attach(name: str) -> SharedMemory:
+    # Clients reuse their blocks, so keep recent attachments mapped
+    shm = _attached.get(name)
+    if shm is not None:
+        _attached.move_to_end(name)
+        return shm
+    shm = SharedMemory(name=name)
+    # The client owns the block; stop this process's resource tracker from
+    # unlinking it when the worker exits
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    _attached[name] = shm
+    while len(_attached) > MAX_ATTACHED_BLOCKS:
+        _, evicted = _attached.popitem(last=False)
+        try:
+            evicted.close()
+        except BufferError:
+            pass
+    return shm
+
+def _view(shm: SharedMemory, spec: Dict[str, Any]) -> np.ndarray:
+    return np.ndarray(spec['shape'], dtype=np.dtype(spec['dtype']), buffer=shm.buf, offset=spec['offset'])
+
+def _run_features(op: str, shm_name: str, inputs: List[Dict[str, Any]], output: Dict[str, Any]) -> List[int]:
+    shm = _attach(shm_name)
+    tensors = {spec['name']: torch.from_numpy(_view(shm, spec)).to(_device) for spec in inputs}
+    with torch.no_grad():
+        if op == 'image_features':
+            features = _model.get_image_features(**tensors)
+        else:
+            features = _model.get_text_features(**tensors)
+    # Result goes straight back into the client's block
+    _view(shm, {**output, 'shape': list(features.shape)})[...] = features.cpu().numpy()
+    del tensors
+    return list(features.shape)
+
+def _ping() -> int:
+    return os.getpid() if _model is not None else 0
+
+# -------------------------------
+# Socket server side
+# -------------------------------
+class InferenceServer:
+    def __init__(self, socket_path: str, pool_size: int, torch_threads: int, device: str = None):
+        self.socket_path = socket_path
+        self.pool_size = pool_size
+        self.torch_threads = torch_threads
+        # Same choice EmbeddingService makes in local mode
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.embedding_dim = CLIPConfig.from_pretrained(MODEL_NAME, cache_dir=cache_dir).projection_dim
+        self.in_flight = 0
+        self.pool = None
+
+    def _start_pool(self):
+        # spawn keeps CUDA/OpenMP state from leaking into the workers
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.pool_size,
+            mp_context=get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.torch_threads, self.device)
+        )
+
+    def _restart_pool(self, broken):
+        # A worker that dies (OOM, segfault) breaks the executor for good.
+        # Several requests can notice at once; only the first replaces it.
+        if self.pool is not broken:
+            return
+        print("CLIP worker pool broken, restarting it")
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._start_pool()
+
+    async def _submit(self, func, *args):
+        loop = asyncio.get_running_loop()
+        pool = self.pool
+        try:
+            return await loop.run_in_executor(pool, func, *args)
+        except BrokenProcessPool:
+            self._restart_pool(pool)
+            raise
+
+    async def serve(self):
+        self._start_pool()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        print(f"CLIP sidecar listening on {self.socket_path} with {self.pool_size} workers")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    async def _handle(self, reader, writer):
+        # One connection per client thread; requests on it are sequential
+        try:
+            while True:
+                request = await read_message(reader)
+                await write_message(writer, await self._dispatch(request))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        op = request.get('op')
+        try:
+            if op == 'health':
+                return await self._health()
+            if op in ('image_features', 'text_features'):
+                self.in_flight += 1
+                try:
+                    shape = await self._submit(
+                        _run_features, op, request['shm'], request['inputs'], request['output']
+                    )
+                finally:
+                    self.in_flight -= 1
+                return {'ok': True, 'shape': shape}
+            return {'ok': False, 'error': f"Unknown op: {op}"}
+        except BrokenProcessPool:
+            return {'ok': False, 'error': "CLIP worker died, pool restarted"}
+        except Exception as e:
+            print(f"Inference error: {str(e)}")
+            return {'ok': False, 'error': str(e)}
+
+    async def _health(self) -> Dict[str, Any]:
+        # A round trip through the pool proves a worker is up with the model loaded
+        pid = await asyncio.wait_for(self._submit(_ping), HEALTH_TIMEOUT)
+        return {
+            'ok': bool(pid),
+            'pool_size': self.pool_size,
+            'torch_threads': self.torch_threads,
+            'device': self.device,
+            'in_flight': self.in_flight,
+            'embedding_dim': self.embedding_dim
+        }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='CLIP inference sidecar')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET_PATH)
+    parser.add_argument('--pool-size', type=int, default=int(os.getenv('CLIP_POOL_SIZE', 2)))
+    parser.add_argument('--torch-threads', type=int, default=int(os.getenv('CLIP_TORCH_THREADS', 1)))
+    parser.add_argument('--device', choices=['cpu', 'cuda'], default=os.getenv('CLIP_SIDECAR_DEVICE'))
+    args = parser.parse_args()
+    asyncio.run(InferenceServer(args.socket, args.pool_size, args.torch_threads, args.device).serve())
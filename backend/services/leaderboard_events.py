@@ -0,0 +1,219 @@
+"""
+Live leaderboard updates for Server-Sent Events subscribers.
+
+Two brokers are available, selected with LEADERBOARD_EVENTS:
+  - local (default): in-process pub/sub. Only subscribers connected to the
+    worker that recorded the solve are notified, fine for a single worker.
+  - changestream: every worker tails a Mongo change stream on the challenges
+    collection and fans leaderboard changes out to its own subscribers.
+    Requires a replica set.
+
+Each subscriber has a bounded queue. A subscriber that falls behind has its
+backlog dropped and receives a single 'resync' event, after which the stream
+sends a fresh snapshot instead of the missed deltas.
+"""
+from threading import Event, Lock, Thread
+from typing import Any, Dict, Optional
+import asyncio
+import json
+import os
+import queue
+import time
+
+SUBSCRIBER_QUEUE_SIZE = 64
+HEARTBEAT_INTERVAL = 15.0
+RESYNC = {'type': 'resync'}
+HEARTBEAT = ": heartbeat\n\n"
+
+class TooManySubscribers(Exception):
+    pass
+
+def format_sse(event: str, data: Any = None) -> str:
+    payload = json.dumps(data if data is not None else {}, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+class Subscription:
+    """
+    Blocking subscription used by the threaded Flask app.
+    """
+    def __init__(self, challenge_id: str, maxsize: int = SUBSCRIBER_QUEUE_SIZE):
+        self.challenge_id = challenge_id
+        self.queue = queue.Queue(maxsize=maxsize)
+        self._lock = Lock()
+
+    def offer(self, event: Dict[str, Any]):
+        # Publishers may race each other, keep overflow handling atomic
+        with self._lock:
+            try:
+                self.queue.put_nowait(event)
+            except queue.Full:
+                self._resync()
+
+    def _resync(self):
+        # Drop the backlog; the stream reloads a snapshot instead
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        self.queue.put_nowait(RESYNC)
+
+    def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class AsyncSubscription(Subscription):
+    """
+    Subscription for the async app. Events may be published from any thread,
+    so they are handed to the subscriber's event loop.
+    """
+    def __init__(self, challenge_id: str, maxsize: int = SUBSCRIBER_QUEUE_SIZE):
+        self.challenge_id = challenge_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def offer(self, event: Dict[str, Any]):
+        self.loop.call_soon_threadsafe(self._offer_nowait, event)
+
+    def _offer_nowait(self, event: Dict[str, Any]):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self._resync()
+
+    def _resync(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(RESYNC)
+
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+class LocalLeaderboardBroker:
+    def __init__(self, max_subscribers: int = None):
+        self.max_subscribers = max_subscribers or int(os.getenv('LEADERBOARD_MAX_SUBSCRIBERS', 1000))
+        self._subscribers: Dict[str, set] = {}
+        self._count = 0
+        self._lock = Lock()
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def subscribe(self, challenge_id: str, asynchronous: bool = False) -> Subscription:
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise TooManySubscribers("Too many live leaderboard subscribers")
+            subscription = AsyncSubscription(challenge_id) if asynchronous else Subscription(challenge_id)
+            self._subscribers.setdefault(challenge_id, set()).add(subscription)
+            self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.challenge_id)
+            if subscribers and subscription in subscribers:
+                subscribers.discard(subscription)
+                self._count -= 1
+                if not subscribers:
+                    del self._subscribers[subscription.challenge_id]
+
+    def publish(self, challenge_id: str, event: Dict[str, Any]):
+        # Called by the app after update_leaderboard changes something
+        self._fan_out(challenge_id, event)
+
+    def _fan_out(self, challenge_id: str, event: Dict[str, Any]):
+        with self._lock:
+            subscribers = list(self._subscribers.get(challenge_id, ()))
+        for subscription in subscribers:
+            subscription.offer(event)
+
+class ChangeStreamLeaderboardBroker(LocalLeaderboardBroker):
+    """
+    Fans out leaderboard changes seen on a change stream, so solves recorded
+    by any worker reach this worker's subscribers. publish() is a no-op: the
+    writing worker gets its own change back from the stream.
+    """
+    def __init__(self, challenges_collection, max_subscribers: int = None):
+        super().__init__(max_subscribers)
+        self.challenges = challenges_collection
+        self._stopped = Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name='leaderboard-changestream', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def publish(self, challenge_id: str, event: Dict[str, Any]):
+        pass
+
+    def _run(self):
+        pipeline = [
+            {'$match': {'operationType': 'update'}},
+            {'$project': {'documentKey': 1, 'updateDescription': 1, 'fullDocument.leaderboard': 1}}
+        ]
+        resume_token = None
+        while not self._stopped.is_set():
+            try:
+                with self.challenges.watch(pipeline, full_document='updateLookup', resume_after=resume_token) as stream:
+                    while not self._stopped.is_set():
+                        change = stream.try_next()
+                        if change is None:
+                            time.sleep(0.1)
+                            continue
+                        resume_token = stream.resume_token
+                        self._handle_change(change)
+            except Exception as e:
+                print(f"Leaderboard change stream error: {str(e)}")
+                time.sleep(1)
+
+    def _handle_change(self, change: Dict[str, Any]):
+        challenge_id = str(change['documentKey']['_id'])
+        updated = change.get('updateDescription', {}).get('updatedFields', {})
+        leaderboard = (change.get('fullDocument') or {}).get('leaderboard') or []
+        for event in leaderboard_events_from_update(updated, leaderboard):
+            self._fan_out(challenge_id, event)
+
+def leaderboard_events_from_update(updated: Dict[str, Any], leaderboard: list) -> list:
+    """
+    Translates a change stream updateDescription into leaderboard deltas.
+    $push shows up as 'leaderboard.N', an improved score as
+    'leaderboard.N.guess_count'; anything else becomes a resync.
+    """
+    events = []
+    for field in updated:
+        parts = field.split('.')
+        if parts[0] != 'leaderboard':
+            continue
+        if len(parts) == 2 and parts[1].isdigit():
+            events.append({'type': 'added', 'entry': updated[field]})
+        elif len(parts) == 3 and parts[1].isdigit() and parts[2] == 'guess_count':
+            index = int(parts[1])
+            if index < len(leaderboard):
+                events.append({'type': 'improved', 'entry': leaderboard[index]})
+            else:
+                events.append(RESYNC)
+        elif len(parts) == 3 and parts[2] == 'username':
+            continue  # sent along with guess_count
+        else:
+            events.append(RESYNC)
+    return events
+
+def create_leaderboard_broker(challenges_collection, max_subscribers: int = None) -> LocalLeaderboardBroker:
+    backend = os.getenv('LEADERBOARD_EVENTS', 'local').lower()
+    if backend == 'local':
+        return LocalLeaderboardBroker(max_subscribers)
+    if backend == 'changestream':
+        return ChangeStreamLeaderboardBroker(challenges_collection, max_subscribers)
+    raise ValueError(f"Unknown LEADERBOARD_EVENTS: {backend}")
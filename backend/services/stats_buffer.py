@@ -0,0 +1,146 @@
+from collections import Counter
+from threading import Event, Lock, Thread
+from typing import Dict
+import os
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+STAT_FIELDS = ('challenges_created', 'challenges_solved', 'total_guesses')
+
+class StatsBuffer:
+    """
+    Write-behind buffer for User.stats counters. Increments are coalesced per
+    user in memory and flushed periodically as one bulk_write of $inc updates,
+    so a guess does not cost an extra Mongo write.
+
+    Writes only ever happen on the flush thread (or in stop()). The buffer is
+    bounded to max_pending_users users: the flush thread is woken early at
+    half that, and past it the oldest users' deltas are dropped and logged.
+    Failed flushes are requeued under the same bound, so a Mongo outage costs
+    stats rather than memory or request latency.
+    """
+    def __init__(self, users_collection, flush_interval: float = None, max_pending_users: int = None):
+        self.users = users_collection
+        self.flush_interval = flush_interval or float(os.getenv('STATS_FLUSH_INTERVAL', 5.0))
+        self.max_pending_users = max_pending_users or int(os.getenv('STATS_MAX_PENDING_USERS', 10000))
+        self._pending: Dict[str, Counter] = {}
+        # Deltas taken by the current flush, still visible to pending_for
+        self._in_flight: Dict[str, Counter] = {}
+        self._lock = Lock()
+        # Serializes flushes so deltas are never written twice or out of order
+        self._flush_lock = Lock()
+        self._wake = Event()
+        self.dropped = 0
+        self._stopped = Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name='stats-buffer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        # Flush whatever is left; safe to call more than once
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+            self._thread = None
+        self.flush()
+
+    def increment(self, user_id: str, **deltas: int):
+        for field in deltas:
+            if field not in STAT_FIELDS:
+                raise ValueError(f"Unknown stat: {field}")
+        with self._lock:
+            pending = self._pending.setdefault(user_id, Counter())
+            pending.update(deltas)
+            dropped = self._enforce_bound()
+            size = len(self._pending)
+        if dropped:
+            print(f"Stats buffer full, dropped deltas for {dropped} users")
+        if size >= self.max_pending_users // 2:
+            self._wake.set()
+
+    def pending_for(self, user_id: str) -> Dict[str, int]:
+        with self._lock:
+            deltas = Counter(self._in_flight.get(user_id, {}))
+            deltas.update(self._pending.get(user_id, {}))
+            return dict(deltas)
+
+    def merge_pending(self, user_id: str, stats: Dict[str, int]) -> Dict[str, int]:
+        # Stored stats plus deltas that have not reached Mongo yet
+        merged = {field: stats.get(field, 0) for field in STAT_FIELDS}
+        for field, delta in self.pending_for(user_id).items():
+            merged[field] += delta
+        return merged
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._in_flight = pending
+            if not pending:
+                return 0
+
+            operations, user_ids = [], []
+            for user_id, deltas in pending.items():
+                if not ObjectId.is_valid(user_id):
+                    print(f"Dropping stats for invalid user id {user_id}")
+                    continue
+                user_ids.append(user_id)
+                operations.append(UpdateOne(
+                    {'_id': ObjectId(user_id)},
+                    {'$inc': {f'stats.{field}': delta for field, delta in deltas.items()}}
+                ))
+            if not operations:
+                self._finish_flush({})
+                return 0
+
+            try:
+                self.users.bulk_write(operations, ordered=False)
+                self._finish_flush({})
+                return len(operations)
+            except BulkWriteError as e:
+                # Unordered writes: only the failed updates need another try
+                failed = {user_ids[error['index']] for error in e.details.get('writeErrors', [])}
+                print(f"Error flushing stats for {len(failed)} users: {str(e)}")
+                self._finish_flush({user_id: pending[user_id] for user_id in failed})
+                return len(operations) - len(failed)
+            except Exception as e:
+                print(f"Error flushing user stats: {str(e)}")
+                self._finish_flush(pending)
+                return 0
+
+    def _finish_flush(self, failed: Dict[str, Counter]):
+        # Ends the in-flight window and puts failed deltas back ahead of
+        # anything recorded since the swap, within the bound
+        with self._lock:
+            self._in_flight = {}
+            if failed:
+                merged = {user_id: Counter(deltas) for user_id, deltas in failed.items()}
+                for user_id, deltas in self._pending.items():
+                    merged.setdefault(user_id, Counter()).update(deltas)
+                self._pending = merged
+            dropped = self._enforce_bound()
+        if dropped:
+            print(f"Stats buffer full after failed flush, dropped deltas for {dropped} users")
+
+    def _enforce_bound(self) -> int:
+        # Caller holds self._lock. Dicts keep insertion order, so the oldest
+        # users are dropped first
+        dropped = 0
+        while len(self._pending) > self.max_pending_users:
+            self._pending.pop(next(iter(self._pending)))
+            dropped += 1
+        self.dropped += dropped
+        return dropped
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stopped.is_set():
+                break
+            self.flush()
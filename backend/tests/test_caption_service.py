@@ -0,0 +1,43 @@
+import threading
+import pytest
+
+pytest.importorskip('torch')
+pytest.importorskip('PIL')
+pytest.importorskip('transformers')
+
+# Both apps and the recaption migration import this at startup
+from services.caption_service import CaptionBatcher, CaptionService, GeminiCaptionService, create_caption_service
+
+def test_caption_service_is_abstract():
+    with pytest.raises(TypeError):
+        CaptionService()
+
+def test_batcher_coalesces_concurrent_submits():
+    calls = []
+    release = threading.Event()
+
+    def caption_images(images):
+        release.wait(5)
+        calls.append(list(images))
+        return [f"caption {image}" for image in images]
+
+    batcher = CaptionBatcher(caption_images, batch_size=4, max_wait_ms=200)
+    futures = [batcher.submit(i) for i in range(3)]
+    release.set()
+
+    assert [future.result(5) for future in futures] == ["caption 0", "caption 1", "caption 2"]
+    assert calls == [[0, 1, 2]]
+
+def test_batcher_fails_every_future_in_a_failed_batch():
+    def caption_images(images):
+        raise RuntimeError("model failed")
+
+    batcher = CaptionBatcher(caption_images, batch_size=4, max_wait_ms=50)
+    futures = [batcher.submit(i) for i in range(2)]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(5)
+
+def test_default_backend_is_gemini(monkeypatch):
+    monkeypatch.delenv('CAPTION_BACKEND', raising=False)
+    assert isinstance(create_caption_service(object()), GeminiCaptionService)
@@ -0,0 +1,54 @@
+import pytest
+
+pytest.importorskip('orjson')
+
+from utils.serialization import ChallengeJSONCache
+
+class FakeChallenge:
+    def __init__(self, challenge_id, version=0):
+        self._id = challenge_id
+        self.version = version
+        self.serialized = 0
+
+    def to_api_dict(self):
+        self.serialized += 1
+        return {'id': self._id, 'version': self.version}
+
+def test_listing_only_loads_misses():
+    cache = ChallengeJSONCache()
+    a, b = FakeChallenge('a'), FakeChallenge('b')
+    versions = [('a', 0), ('b', 0)]
+
+    hits, missing = cache.lookup(versions)
+    assert hits == {} and missing == ['a', 'b']
+    first = cache.dumps_list(versions, hits, [b, a])
+
+    hits, missing = cache.lookup(versions)
+    assert missing == []
+    assert cache.dumps_list(versions, hits, []) == first
+    assert first == b'[{"id":"a","version":0},{"id":"b","version":0}]'
+    assert a.serialized == b.serialized == 1
+
+def test_version_bump_is_a_miss():
+    cache = ChallengeJSONCache()
+    cache.dumps_list([('a', 0)], {}, [FakeChallenge('a')])
+
+    hits, missing = cache.lookup([('a', 1)])
+    assert hits == {} and missing == ['a']
+
+def test_cache_grows_to_the_listing():
+    cache = ChallengeJSONCache(max_entries=2)
+    challenges = [FakeChallenge(str(i)) for i in range(5)]
+    versions = [(c._id, 0) for c in challenges]
+
+    hits, missing = cache.lookup(versions)
+    cache.dumps_list(versions, hits, challenges)
+
+    hits, missing = cache.lookup(versions)
+    assert cache.max_entries == 5
+    assert missing == []
+
+def test_challenge_deleted_between_queries_is_skipped():
+    cache = ChallengeJSONCache()
+    body = cache.dumps_list([('a', 0), ('gone', 0)], {}, [FakeChallenge('a')])
+    assert body == b'[{"id":"a","version":0}]'
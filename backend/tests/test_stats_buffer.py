@@ -0,0 +1,113 @@
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, ServerSelectionTimeoutError
+from services.stats_buffer import StatsBuffer
+
+class FakeUsers:
+    """
+    Records bulk_write calls; `errors` is a list of exceptions (or None)
+    raised by successive calls.
+    """
+    def __init__(self, errors=None):
+        self.calls = []
+        self.errors = list(errors or [])
+        self.on_write = None
+
+    def bulk_write(self, operations, ordered=True):
+        self.calls.append(operations)
+        if self.on_write:
+            self.on_write()
+        if self.errors:
+            error = self.errors.pop(0)
+            if error is not None:
+                raise error
+
+def inc_by_user(operations):
+    return {str(op._filter['_id']): op._doc['$inc'] for op in operations}
+
+def user_ids(count):
+    return [str(ObjectId()) for _ in range(count)]
+
+def test_increments_are_coalesced_per_user():
+    users = FakeUsers()
+    buffer = StatsBuffer(users, flush_interval=60, max_pending_users=100)
+    alice, bob = user_ids(2)
+
+    buffer.increment(alice, total_guesses=1)
+    buffer.increment(alice, total_guesses=1, challenges_solved=1)
+    buffer.increment(bob, challenges_created=1)
+
+    assert buffer.flush() == 2
+    assert len(users.calls) == 1
+    assert inc_by_user(users.calls[0]) == {
+        alice: {'stats.total_guesses': 2, 'stats.challenges_solved': 1},
+        bob: {'stats.challenges_created': 1},
+    }
+    assert buffer.flush() == 0
+    assert len(users.calls) == 1
+
+def test_unknown_stat_is_rejected():
+    buffer = StatsBuffer(FakeUsers(), flush_interval=60, max_pending_users=100)
+    try:
+        buffer.increment(user_ids(1)[0], logins=1)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError")
+
+def test_partial_bulk_write_error_requeues_only_failed_users():
+    alice, bob = user_ids(2)
+    error = BulkWriteError({'writeErrors': [{'index': 1, 'code': 1, 'errmsg': 'boom'}]})
+    users = FakeUsers(errors=[error])
+    buffer = StatsBuffer(users, flush_interval=60, max_pending_users=100)
+    buffer.increment(alice, total_guesses=1)
+    buffer.increment(bob, total_guesses=3)
+
+    assert buffer.flush() == 1
+    assert buffer.pending_for(alice) == {}
+    assert buffer.pending_for(bob) == {'total_guesses': 3}
+
+    buffer.flush()
+    assert inc_by_user(users.calls[1]) == {bob: {'stats.total_guesses': 3}}
+
+def test_failed_flush_requeues_within_bound_and_drops_oldest():
+    first, second, third = user_ids(3)
+    users = FakeUsers(errors=[ServerSelectionTimeoutError('down')])
+    buffer = StatsBuffer(users, flush_interval=60, max_pending_users=2)
+    buffer.increment(first, total_guesses=1)
+    buffer.increment(second, total_guesses=1)
+
+    # Recorded while the failing write is in progress
+    users.on_write = lambda: buffer.increment(third, total_guesses=1)
+    assert buffer.flush() == 0
+
+    assert buffer.pending_for(first) == {}
+    assert buffer.pending_for(second) == {'total_guesses': 1}
+    assert buffer.pending_for(third) == {'total_guesses': 1}
+    assert buffer.dropped == 1
+
+def test_increment_never_writes_on_caller_thread():
+    users = FakeUsers()
+    buffer = StatsBuffer(users, flush_interval=60, max_pending_users=3)
+    for user_id in user_ids(10):
+        buffer.increment(user_id, total_guesses=1)
+
+    assert users.calls == []
+    assert buffer.dropped == 7
+    assert buffer._wake.is_set()
+
+def test_merge_pending_includes_deltas_of_a_flush_in_progress():
+    alice = user_ids(1)[0]
+    users = FakeUsers()
+    buffer = StatsBuffer(users, flush_interval=60, max_pending_users=100)
+    buffer.increment(alice, total_guesses=2)
+
+    seen = {}
+    def during_write():
+        buffer.increment(alice, total_guesses=1)
+        seen['merged'] = buffer.merge_pending(alice, {'total_guesses': 10})
+    users.on_write = during_write
+    buffer.flush()
+
+    assert seen['merged'] == {'challenges_created': 0, 'challenges_solved': 0, 'total_guesses': 13}
+    # The in-flight deltas are written; only the later increment remains
+    assert buffer.merge_pending(alice, {'total_guesses': 12})['total_guesses'] == 13
@@ -0,0 +1,50 @@
+from typing import Any, Dict, Optional
+import os
+import numpy as np
+from bson.binary import Binary
+
+# Bump when the stored layout changes so old documents can still be decoded
+EMBEDDING_FORMAT_VERSION = 1
+SUPPORTED_DTYPES = {'float32': '<f4', 'float16': '<f2'}
+
+def default_dtype() -> str:
+    # float16 halves storage again at ~3 significant digits, enough for cosine similarity
+    dtype = os.getenv('EMBEDDING_DTYPE', 'float32')
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported EMBEDDING_DTYPE: {dtype}")
+    return dtype
+
+def encode_embedding(embedding: Optional[np.ndarray], dtype: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Packs an embedding into a BSON subdocument holding the raw little-endian
+    bytes instead of an array of doubles.
+    """
+    if embedding is None:
+        return None
+    dtype = dtype or default_dtype()
+    array = np.ascontiguousarray(embedding, dtype=SUPPORTED_DTYPES[dtype])
+    return {
+        'v': EMBEDDING_FORMAT_VERSION,
+        'dtype': dtype,
+        'shape': list(array.shape),
+        'data': Binary(array.tobytes())
+    }
+
+def decode_embedding(value: Any) -> Optional[np.ndarray]:
+    """
+    Returns a float32 array from a stored embedding. Accepts the binary format
+    as well as legacy lists of doubles written before the migration.
+    """
+    if value is None:
+        return None
+    if isinstance(value, np.ndarray):
+        return value.astype(np.float32, copy=False)
+    if isinstance(value, dict):
+        if value.get('v') != EMBEDDING_FORMAT_VERSION:
+            raise ValueError(f"Unknown embedding format version: {value.get('v')}")
+        # frombuffer shares memory with the BSON bytes, no per-element copy
+        array = np.frombuffer(value['data'], dtype=SUPPORTED_DTYPES[value['dtype']])
+        array = array.reshape(value['shape'])
+        # float16 needs widening; float32 stays a read-only view
+        return array.astype(np.float32, copy=False)
+    return np.array(value, dtype=np.float32)
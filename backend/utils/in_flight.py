@@ -0,0 +1,28 @@
+from threading import Lock
+from typing import Dict
+
+class InFlightGauge:
+    """
+    Counts requests the server is working on right now and the peak since the
+    last reset. load_test.py reads it to compare app.py and async_app.py.
+    """
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+        self._lock = Lock()
+
+    def enter(self):
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def exit(self):
+        with self._lock:
+            self.current -= 1
+
+    def snapshot(self, reset: bool = False) -> Dict[str, int]:
+        with self._lock:
+            snapshot = {'current': self.current, 'peak': self.peak}
+            if reset:
+                self.peak = self.current
+        return snapshot
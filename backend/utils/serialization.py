@@ -0,0 +1,127 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+import gzip
+import orjson
+from bson import ObjectId
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, fall back to gzip only
+    brotli = None
+
+# Responses smaller than this are not worth the compression overhead
+COMPRESSION_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+# orjson handles numpy arrays and datetimes natively and writes NaN/Infinity as null
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+def _default(value: Any) -> Any:
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dumps(payload: Any) -> bytes:
+    return orjson.dumps(payload, default=_default, option=ORJSON_OPTIONS)
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Picks br or gzip from an Accept-Encoding header, honouring q=0.
+    """
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+def compress(body: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+def encode_response(body: bytes, accept_encoding: Optional[str] = None, compressible: bool = False) -> Tuple[bytes, Dict[str, str]]:
+    """
+    Returns the response body and headers, compressing large payloads when
+    the client supports it.
+    """
+    headers = {'Content-Type': 'application/json'}
+    if compressible:
+        headers['Vary'] = 'Accept-Encoding'
+        if len(body) >= COMPRESSION_MIN_SIZE:
+            encoding = choose_encoding(accept_encoding)
+            if encoding:
+                body = compress(body, encoding)
+                headers['Content-Encoding'] = encoding
+    return body, headers
+
+class ChallengeJSONCache:
+    """
+    LRU of serialized challenges keyed by (id, version). A challenge
+    document's version is bumped on every write, so stale entries are never
+    served and simply age out. Listings grow the cache to the collection size
+    so a full listing never evicts its own entries.
+    """
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, challenge) -> bytes:
+        key = (str(getattr(challenge, '_id', '')), getattr(challenge, 'version', 0))
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                return body
+        body = dumps(challenge.to_api_dict())
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return body
+
+    def lookup(self, versions: List[Tuple[str, int]]) -> Tuple[Dict[str, bytes], List[str]]:
+        """
+        Splits the (id, version) pairs of a listing into cached bodies and the
+        ids whose full documents still have to be loaded.
+        """
+        hits, missing = {}, []
+        with self._lock:
+            self.max_entries = max(self.max_entries, len(versions))
+            for key in versions:
+                body = self._entries.get(key)
+                if body is None:
+                    missing.append(key[0])
+                else:
+                    self._entries.move_to_end(key)
+                    hits[key[0]] = body
+        return hits, missing
+
+    def dumps_list(self, versions: List[Tuple[str, int]], hits: Dict[str, bytes], loaded: List) -> bytes:
+        # Splice the per-challenge bytes into one JSON array, in listing order
+        loaded = {str(challenge._id): challenge for challenge in loaded}
+        bodies = []
+        for challenge_id, _ in versions:
+            if challenge_id in hits:
+                bodies.append(hits[challenge_id])
+            elif challenge_id in loaded:
+                bodies.append(self.get(loaded[challenge_id]))
+            # Otherwise it was deleted between the two queries
+        return b'[' + b','.join(bodies) + b']'
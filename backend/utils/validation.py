@@ -0,0 +1,26 @@
+import magic
+
+# Configuration
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def validate_image(file):
+    if not file:
+        return False, "No file provided"
+    if not allowed_file(file.filename):
+        return False, "Invalid file type"
+    if file.content_length and file.content_length > MAX_CONTENT_LENGTH:
+        return False, "File too large"
+        
+    # Check MIME type using the first 1024 bytes
+    mime = magic.Magic(mime=True)
+    file_mime = mime.from_buffer(file.read(1024))
+    file.seek(0)
+    
+    if not file_mime.startswith('image/'):
+        return False, "Invalid file type"
+        
+    return True, None